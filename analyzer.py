@@ -3,15 +3,22 @@ import json
 import re
 import base64
 import io
-from typing import Dict, Any, Optional, List
+import hashlib
+import math
+import time
+import threading
+import atexit
+from typing import Dict, Any, Optional, List, BinaryIO
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 import numpy as np
-from wordcloud import WordCloud
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 
-# Import AI providers based on configuration
+# Import AI providers once, based on configuration
+genai = None
+Groq = None
 if Config.AI_PROVIDER == 'gemini':
     try:
         import google.generativeai as genai
@@ -22,102 +29,127 @@ if Config.AI_PROVIDER == 'gemini':
 elif Config.AI_PROVIDER == 'groq':
     try:
         from groq import Groq
+        import httpx
     except ImportError:
         print("groq not installed. Install with: pip install groq")
 
-class DocumentAnalyzer:
-    """Analyzes documents and generates dashboard JSON"""
+# Characters of document text each LLM call actually sees
+GROQ_TEXT_LIMIT = 25000
+CHAT_TEXT_LIMIT = 20000
+GEMINI_TEXT_LIMIT = 15000
+
+# Connection pool shared by all Groq clients in the process
+GROQ_HTTP_LIMITS = dict(max_keepalive_connections=16, max_connections=32)
+GROQ_HTTP_TIMEOUT = dict(timeout=60.0, connect=5.0)
+
+# Attempts per LLM call before giving up (backoff doubles from 1s)
+# SDK clients are built with max_retries=0 so these are the only retries
+LLM_MAX_ATTEMPTS = 3
+
+# Characters extracted for LLM providers. The prompt samples the head,
+# middle and tail of this text, so it must reach well past the prompt
+# window; it still bounds parsing work on very large documents.
+LLM_EXTRACT_LIMIT = 250000
+
+# PDFium is not thread-safe, even across separate documents
+_PDFIUM_LOCK = threading.Lock()
+
+# Precompiled patterns
+_FENCE_RE = re.compile(r'^```[a-z]*\s*|\s*```$', re.IGNORECASE)
+_ABSTRACT_RE = re.compile(r'(abstract|summary|executive summary)[:\s]+(.*?)(?=\n\n|\Z)',
+                          re.IGNORECASE | re.DOTALL)
+_CONCLUSION_RE = re.compile(r'(conclusion|summary|findings)[:\s]+(.*?)(?=\n\n|\Z)',
+                            re.IGNORECASE | re.DOTALL)
+_NUM_RE = re.compile(r'\b\d+\.?\d*\b')
+_FLOW_RE = re.compile(r'\b(?:from|to|flow|transfer|allocation|budget)\b', re.IGNORECASE)
+
+# Characters scanned for pipe/tab tables; the text itself is unbounded
+TABLE_SCAN_LIMIT = 200000
+
+# Shortest text worth building supplementary visuals (word cloud, tables,
+# heatmap, Sankey) from; these only ever serve the rule-based dashboard
+MIN_VISUAL_TEXT = 200
+
+# Largest heatmap matrix generated from document numbers
+HEATMAP_MAX_SIZE = 5
+
+# Rendered word clouds keyed by a digest of the source text
+_WORD_CLOUD_CACHE: "OrderedDict[str, str]" = OrderedDict()
+WORD_CLOUD_CACHE_SIZE = 32
+
+def _touch_cache_entry(path: str) -> None:
+    """Mark a cache entry as recently used (pruning goes by mtime)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _prune_cache() -> None:
+    """Keep Config.CACHE_FOLDER under its age and size caps, oldest entries first"""
+    try:
+        entries = []
+        with os.scandir(Config.CACHE_FOLDER) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
     
-    def __init__(self):
-        self.ai_provider = Config.AI_PROVIDER
-        self.model = None
-        
-        if self.ai_provider == 'groq':
-            if Config.GROQ_API_KEY:
-                try:
-                    from groq import Groq
-                    self.client = Groq(api_key=Config.GROQ_API_KEY)
-                    self.model = 'groq'
-                    print(f"✓ Using Groq API with model: {Config.GROQ_MODEL}")
-                except Exception as e:
-                    print(f"Failed to initialize Groq: {e}")
-                    print("Get your free API key from: https://console.groq.com")
-            else:
-                print("⚠ GROQ_API_KEY not set. Using fallback analysis.")
-                print("Get your free API key from: https://console.groq.com")
-                
-        elif self.ai_provider == 'gemini' and Config.GEMINI_API_KEY:
-            try:
-                import google.generativeai as genai
-                self.model = genai.GenerativeModel('gemini-pro')
-                print("✓ Using Google Gemini")
-            except Exception as e:
-                print(f"Failed to initialize Gemini: {e}")
+    entries.sort()
+    cutoff = time.time() - Config.CACHE_MAX_AGE_DAYS * 86400
+    total = sum(size for _, size, _ in entries)
+    limit = Config.CACHE_MAX_MB * 1024 * 1024
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def file_extension(filename: str) -> str:
+    """Lower-cased text after the last dot (the whole name if there is none)"""
+    # One reverse scan and one slice; no list of split parts
+    return filename[filename.rfind('.') + 1:].lower()
+
+def _slice_for_llm(text: str, budget: int) -> str:
+    """Fit text into budget characters, keeping its head, middle and tail
     
-    def extract_text(self, file_path: str) -> str:
-        """Extract text from uploaded file"""
-        ext = file_path.lower().split('.')[-1]
-        
-        if ext == 'txt':
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        
-        elif ext == 'pdf':
-            try:
-                import PyPDF2
-                text = ""
-                with open(file_path, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                return text
-            except Exception as e:
-                return f"Error extracting PDF: {e}"
-        
-        elif ext in ['docx', 'doc']:
-            try:
-                import docx
-                doc = docx.Document(file_path)
-                return "\n".join([para.text for para in doc.paragraphs])
-            except Exception as e:
-                return f"Error extracting DOCX: {e}"
-        
-        return ""
+    Plain truncation drops the end of long documents, where conclusions
+    usually are. Long text is sampled as 3/5 head, 1/5 middle, 1/5 tail.
+    """
+    if len(text) <= budget:
+        return text
+    head = budget * 3 // 5
+    tail = budget // 5
+    mid = budget - head - tail
+    center = len(text) // 2
+    return (text[:head] + "\n\n[...]\n\n"
+            + text[center - mid // 2:center + mid - mid // 2]
+            + "\n\n[...]\n\n" + text[-tail:])
+
+def _typed_array(arr: np.ndarray) -> Dict[str, str]:
+    """Encode an array as a Plotly.js base64 typed array
     
-    def analyze_document(self, file_path: str, custom_prompt: str = "", summary_length: str = "Standard") -> Dict[str, Any]:
-        """Analyze document and return dashboard JSON"""
-        
-        # Extract text
-        text = self.extract_text(file_path)
-        
-        if not text or len(text.strip()) < 100:
-            return self._generate_error_response("Document too short or empty")
-        
-        # Use AI if available
-        if self.model:
-            if self.ai_provider == 'groq':
-                return self._analyze_with_groq(text, custom_prompt, summary_length)
-            elif self.ai_provider == 'gemini':
-                return self._analyze_with_gemini(text)
-        
-        # Fallback to rule-based analysis
-        return self._analyze_with_rules(text)
+    Plotly.js (>= 2.28) decodes {"dtype", "bdata", "shape"} objects in
+    place of nested lists: dtype is a numpy-style code ("f4", "i4", ...),
+    bdata the base64 of the little-endian buffer, and shape a
+    comma-separated string for multi-dimensional data such as heatmap z.
+    """
+    encoded = {
+        "dtype": arr.dtype.str.lstrip('<|='),
+        "bdata": base64.b64encode(arr.tobytes()).decode('ascii'),
+    }
+    if arr.ndim > 1:
+        encoded["shape"] = ",".join(str(n) for n in arr.shape)
+    return encoded
 
-    def _analyze_with_groq(self, text: str, custom_prompt: str = "", summary_length: str = "Standard") -> Dict[str, Any]:
-        """Analyze using Groq API and generate complete custom HTML/CSS dashboard"""
-        
-        # Incorporate user preferences
-        user_instructions = ""
-        if custom_prompt:
-            user_instructions = f"\nUSER CUSTOM INSTRUCTIONS:\n{custom_prompt}\n(Prioritize these instructions over default behavior)"
-            
-        summary_instruction = ""
-        if summary_length == "Brief":
-            summary_instruction = "Keep summaries concise and high-level. Focus on bullet points."
-        elif summary_length == "Detailed":
-            summary_instruction = "Provide in-depth comprehensive summaries and detailed analysis."
-        
-        prompt = f"""You are an elite Frontend Developer and UI/UX Designer. Your task is to analyze the provided document and create a WORLD-CLASS, HIGHLY RESPONSIVE, and ANIMATED HTML dashboard with ADVANCED VISUALIZATIONS.
+# Static system prompt for Groq dashboard generation. Kept byte-identical
+# across requests so the provider can reuse its cached prefix; everything
+# request-specific goes in the user message.
+GROQ_SYSTEM_PROMPT = """You are an elite Frontend Developer and UI/UX Designer. Your task is to analyze the provided document and create a WORLD-CLASS, HIGHLY RESPONSIVE, and ANIMATED HTML dashboard with ADVANCED VISUALIZATIONS.
 
 CRITICAL DESIGN REQUIREMENTS:
 1.  **Visual Style**: Use a modern, premium aesthetic (Glassmorphism, subtle gradients, deep shadows).
@@ -162,7 +194,7 @@ ADVANCED VISUALIZATION REQUIREMENTS:
 4.  **Standard Charts**: Continue using Chart.js for bar, line, pie, and doughnut charts.
 
 CONTENT GENERATION:
--   **Analyze** the document text below.
+-   **Analyze** the document text provided in the user message.
 -   **Extract** meaningful sections (Abstract, Key Metrics, Findings, Conclusion).
 -   **Visualize** data intelligently:
     -   Standard charts (Bar, Line, Doughnut) for basic metrics
@@ -171,7 +203,7 @@ CONTENT GENERATION:
     -   Interactive tables for structured data
 -   **Structure**:
     -   Header (Title, Subtitle, Export Buttons)
-    -   Executive Summary / Abstract ({summary_length} length. {summary_instruction})
+    -   Executive Summary / Abstract (length and focus as given under SUMMARY LENGTH in the user message)
     -   Key Metrics Grid (Cards with big numbers)
     -   Detailed Analysis Sections
     -   Advanced Charts Section (Heatmaps, Sankey if applicable)
@@ -190,84 +222,38 @@ Include these buttons in the header:
 </div>
 ```
 
-{user_instructions}
-
 OUTPUT FORMAT:
 Return ONLY the raw HTML code. Start with `<!DOCTYPE html>`. Do not wrap in markdown code blocks.
+"""
 
+# Prompt templates. Only the {placeholders} change per request, so the
+# text before the first one is byte-identical across calls; editing a
+# template invalidates any provider-side prefix cache built on it.
+GROQ_USER_TMPL = """SUMMARY LENGTH: {summary_length}. {summary_instruction}
+{user_instructions}
 -------------------------------------
 DOCUMENT CONTENT:
 -------------------------------------
 
-{text[:25000]}
+{text}
 
 -------------------------------------
 GENERATE THE HTML DASHBOARD NOW:
 """
-        
-        try:
-            # Call Groq API
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model=Config.GROQ_MODEL,
-                temperature=0.5,
-                max_tokens=8000,
-            )
-            
-            html_content = chat_completion.choices[0].message.content.strip()
-            
-            # Remove markdown code blocks if present
-            html_content = re.sub(r'^```html\s*', '', html_content)
-            html_content = re.sub(r'^```\s*', '', html_content)
-            html_content = re.sub(r'\s*```$', '', html_content)
-            
-            # Return in format expected by Flask
-            return {
-                "html_content": html_content,
-                "is_custom_html": True,
-                "text_content": text # Return text for chat context
-            }
-            
-        except Exception as e:
-            print(f"Groq API error: {e}")
-            print("Falling back to rule-based analysis...")
-            return self._analyze_with_rules(text)
 
-    def chat_with_document(self, text: str, question: str) -> str:
-        """Chat with the document using Groq"""
-        if not self.client:
-            return "AI Chat not available (Groq API key missing)."
-            
-        prompt = f"""You are a helpful AI assistant. Answer the user's question based ONLY on the document content provided below.
+CHAT_PROMPT_TMPL = """You are a helpful AI assistant. Answer the user's question based ONLY on the document content provided below.
         
 DOCUMENT CONTENT:
-{text[:20000]}
+{text}
 
 USER QUESTION:
 {question}
 
 ANSWER:
 """
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=Config.GROQ_MODEL,
-                temperature=0.3,
-                max_tokens=1000,
-            )
-            return chat_completion.choices[0].message.content.strip()
-        except Exception as e:
-            return f"Error generating answer: {str(e)}"
-    
-    def _analyze_with_gemini(self, text: str) -> Dict[str, Any]:
-        """Analyze using Gemini API"""
-        
-        prompt = f"""You are a Research Dashboard Generator AI.
+
+# Literal JSON braces are doubled for str.format
+GEMINI_PROMPT_TMPL = """You are a Research Dashboard Generator AI.
 Your job is to analyze academic papers, research reports, feasibility studies, business strategy documents, or any complex text.
 You must return a structured JSON output that the Flask backend will convert into a dynamic HTML dashboard AND a Canvas-renderable HTML fragment.
 Your output is NOT a fixed set of sections. You must decide which sections are relevant based on the document's actual content.
@@ -403,17 +389,489 @@ Return ONLY the JSON object.
 DOCUMENT TO ANALYZE:
 -------------------------------------
 
-{text[:15000]}
+{text}
 """
+
+class ChatErrorText(str):
+    """An error message standing in for a chat answer (never cache these)"""
+    __slots__ = ()
+
+@dataclass
+class Section:
+    """A dashboard section produced by the rule-based analyzer"""
+    # Declared by hand: dataclass(slots=True) needs Python 3.10. A slot
+    # can't also have a class-level default, so chart is always passed.
+    __slots__ = ('id', 'title', 'content_html', 'chart')
+    id: str
+    title: str
+    content_html: str
+    chart: Optional[Dict[str, Any]]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Dashboard JSON shape (shallow; cheaper than dataclasses.asdict)"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "content_html": self.content_html,
+            "chart": self.chart
+        }
+
+class DocumentAnalyzer:
+    """Analyzes documents and generates dashboard JSON"""
+    
+    # One keep-alive pool for every instance, so TLS handshakes are paid once
+    _shared_http = None
+    
+    @classmethod
+    def _get_shared_http(cls):
+        if cls._shared_http is None:
+            cls._shared_http = httpx.Client(
+                limits=httpx.Limits(**GROQ_HTTP_LIMITS),
+                timeout=httpx.Timeout(**GROQ_HTTP_TIMEOUT)
+            )
+            atexit.register(cls._shared_http.close)
+        return cls._shared_http
+    
+    def __init__(self):
+        self.ai_provider = Config.AI_PROVIDER
+        self.model = None
+        self.client = None
+        
+        if self.ai_provider == 'groq':
+            if Config.GROQ_API_KEY:
+                try:
+                    self.client = Groq(api_key=Config.GROQ_API_KEY, max_retries=0, http_client=self._get_shared_http())
+                    self.model = 'groq'
+                    print(f"✓ Using Groq API with model: {Config.GROQ_MODEL}")
+                except Exception as e:
+                    print(f"Failed to initialize Groq: {e}")
+                    print("Get your free API key from: https://console.groq.com")
+            else:
+                print("⚠ GROQ_API_KEY not set. Using fallback analysis.")
+                print("Get your free API key from: https://console.groq.com")
+                
+        elif self.ai_provider == 'gemini' and Config.GEMINI_API_KEY:
+            try:
+                self.model = genai.GenerativeModel('gemini-pro')
+                print("✓ Using Google Gemini")
+            except Exception as e:
+                print(f"Failed to initialize Gemini: {e}")
+    
+    def extract_text(self, file_path: str, max_chars: Optional[int] = None) -> str:
+        """Extract text from uploaded file
+        
+        When max_chars is set, extraction stops once that many characters
+        have been collected; content past the LLM window is never parsed.
+        """
+        with open(file_path, 'rb') as f:
+            return self.extract_text_stream(f, file_path, max_chars)
+    
+    def extract_text_stream(self, stream: BinaryIO, filename: str, max_chars: Optional[int] = None) -> str:
+        """Extract text from a seekable binary stream, dispatching on filename"""
+        ext = file_extension(filename)
+        
+        if ext == 'txt':
+            # UTF-8 needs at most 4 bytes per character
+            data = stream.read(max_chars * 4) if max_chars else stream.read()
+            # Same newline translation text-mode open() applied
+            text = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+            return text[:max_chars] if max_chars else text
+        
+        elif ext == 'pdf':
+            try:
+                return "\n".join(self._iter_pdf_pages(stream, max_chars))
+            except Exception as e:
+                return f"Error extracting PDF: {e}"
         
+        elif ext in ['docx', 'doc']:
+            try:
+                import docx
+                doc = docx.Document(stream)
+                parts = []
+                total = 0
+                for para in doc.paragraphs:
+                    para_text = para.text
+                    parts.append(para_text)
+                    total += len(para_text)
+                    if max_chars and total >= max_chars:
+                        break
+                return "\n".join(parts)
+            except Exception as e:
+                return f"Error extracting DOCX: {e}"
+        
+        return ""
+    
+    def _iter_pdf_pages(self, stream: BinaryIO, max_chars: Optional[int] = None):
+        """Yield PDF page texts until max_chars characters have been produced
+        
+        Uses pypdfium2 (PDFium, native code) when installed and falls back
+        to the pure-Python PyPDF2 reader otherwise.
+        """
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            pdfium = None
+        
+        total = 0
+        if pdfium is not None:
+            # Pages are collected under the lock rather than yielded, so a
+            # slow consumer never holds it
+            page_texts = []
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(stream)
+                try:
+                    for index in range(len(pdf)):
+                        page = pdf[index]
+                        try:
+                            textpage = page.get_textpage()
+                            try:
+                                # PDFium separates lines with CRLF; match PyPDF2 and the txt branch
+                                page_text = textpage.get_text_range().replace('\r\n', '\n').replace('\r', '\n')
+                            finally:
+                                textpage.close()
+                        finally:
+                            page.close()
+                        page_texts.append(page_text)
+                        total += len(page_text)
+                        if max_chars and total >= max_chars:
+                            break
+                finally:
+                    pdf.close()
+            yield from page_texts
+            return
+        
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(stream)
+        for page in pdf_reader.pages:
+            page_text = page.extract_text() or ""
+            yield page_text
+            total += len(page_text)
+            if max_chars and total >= max_chars:
+                return
+    
+    def extract_text_batch(self, file_paths: List[str], max_chars: Optional[int] = None) -> List[str]:
+        """Extract text from several files concurrently, preserving order"""
+        if not file_paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+            return list(executor.map(lambda path: self.extract_text(path, max_chars), file_paths))
+    
+    def analyze_document(self, file_path: str, custom_prompt: str = "", summary_length: str = "Standard") -> Dict[str, Any]:
+        """Analyze document and return dashboard JSON"""
+        with open(file_path, 'rb') as f:
+            return self.analyze_document_stream(f, file_path, custom_prompt, summary_length)
+
+    def analyze_document_stream(self, stream: BinaryIO, filename: str, custom_prompt: str = "", summary_length: str = "Standard", digest: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze an in-memory or spooled upload without writing it to disk
+        
+        Pass the stream's SHA-256 hex digest when the caller already has it.
+        """
+        
+        # Repeat uploads of the same file with the same options are served from cache
+        digest = digest or self._stream_digest(stream)
+        cache_key = self._cache_key(digest, filename, custom_prompt, summary_length)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Extract text, stopping once the active provider's window is full
+        text = self._extract_text_cached(stream, filename, digest, self._text_budget())
+        
+        if not text or len(text.strip()) < 100:
+            return self._generate_error_response("Document too short or empty")
+        
+        # Use AI if available
+        if self.model:
+            if self.ai_provider == 'groq':
+                result = self._analyze_with_groq(text, custom_prompt, summary_length)
+            elif self.ai_provider == 'gemini':
+                result = self._analyze_with_gemini(text)
+            else:
+                result = self._analyze_with_rules(text)
+        else:
+            # Fallback to rule-based analysis
+            result = self._analyze_with_rules(text)
+        
+        if self.is_cacheable(result):
+            self._cache_set(cache_key, result)
+        return result
+
+    def iter_dashboard_stream(self, stream: BinaryIO, filename: str, custom_prompt: str = "", summary_length: str = "Standard", digest: Optional[str] = None):
+        """Analyze a document, yielding Groq's HTML as it is generated
+        
+        Yields {"delta": str} events while the model streams, then one
+        {"result": dict} event holding what analyze_document would return.
+        If the stream fails after deltas were sent, a {"reset": str} event
+        comes first: discard the deltas, the result is a rule-based fallback.
+        Cache hits and non-Groq providers yield only the result event.
+        `digest` is as for analyze_document_stream.
+        """
+        if not (self.model and self.ai_provider == 'groq'):
+            yield {"result": self.analyze_document_stream(stream, filename, custom_prompt, summary_length, digest)}
+            return
+        
+        digest = digest or self._stream_digest(stream)
+        cache_key = self._cache_key(digest, filename, custom_prompt, summary_length)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield {"result": cached}
+            return
+        
+        text = self._extract_text_cached(stream, filename, digest, self._text_budget())
+        if not text or len(text.strip()) < 100:
+            yield {"result": self._generate_error_response("Document too short or empty")}
+            return
+        
+        messages = self._build_groq_messages(text, custom_prompt, summary_length)
+        parts = []
+        try:
+            completion = self._call_with_retries(lambda: self.client.chat.completions.create(
+                messages=messages,
+                model=Config.GROQ_MODEL,
+                temperature=0.5,
+                max_tokens=8000,
+                stream=True,
+            ))
+            for chunk in completion:
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    parts.append(delta)
+                    yield {"delta": delta}
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            print("Falling back to rule-based analysis...")
+            if parts:
+                # Retries only cover opening the stream; the partial HTML is unusable
+                yield {"reset": f"Generation interrupted: {e}"}
+            yield {"result": self._fallback_result(text)}
+            return
+        
+        # Code fences are stripped once, on the assembled copy
+        result = self._groq_html_result("".join(parts), text)
+        if not result["html_content"]:
+            # An empty page must not be saved, cached and served to repeat uploads
+            print("Groq API error: empty response")
+            print("Falling back to rule-based analysis...")
+            if parts:
+                yield {"reset": "Generation returned no HTML"}
+            yield {"result": self._fallback_result(text)}
+            return
+        self._cache_set(cache_key, result)
+        yield {"result": result}
+
+    @staticmethod
+    def _stream_digest(stream: BinaryIO) -> str:
+        """Return the SHA-256 hex digest of a stream's bytes, then rewind it"""
+        h = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            h.update(chunk)
+        stream.seek(0)
+        return h.hexdigest()
+
+    def _cache_key(self, digest: str, filename: str, custom_prompt: str, summary_length: str) -> str:
+        """Combine the file digest with every option that changes the result"""
+        # The extension picks the parser, so the same bytes as .txt and .pdf differ
+        # hashlib rather than hash(): str hashes are salted per process
+        params = '\0'.join([file_extension(filename), custom_prompt, summary_length, self.analysis_mode, Config.GROQ_MODEL])
+        return f"{digest}-{hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]}"
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load a cached analysis result, or None on miss"""
+        path = os.path.join(Config.CACHE_FOLDER, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _touch_cache_entry(path)
+        return result
+
+    def _cache_set(self, key: str, result: Dict[str, Any]) -> None:
+        """Store an analysis result; cache failures never fail the analysis"""
+        path = os.path.join(Config.CACHE_FOLDER, f"{key}.json")
         try:
-            response = self.model.generate_content(prompt)
+            os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+        except (OSError, TypeError) as e:
+            print(f"Cache write error: {e}")
+        _prune_cache()
+
+    @property
+    def analysis_mode(self) -> str:
+        """The provider results actually come from ('rules' without a model)"""
+        return self.ai_provider if self.model else 'rules'
+
+    def is_cacheable(self, result: Dict[str, Any]) -> bool:
+        """Skip error responses and rule-based fallbacks after an API failure"""
+        return result.get('share_ready') is not False and not result.get('is_fallback')
+
+    def _fallback_result(self, text: str) -> Dict[str, Any]:
+        """Rule-based stand-in after an LLM failure, flagged so it is never cached"""
+        result = self._analyze_with_rules(text)
+        result['is_fallback'] = True
+        return result
+
+    def _text_budget(self) -> Optional[int]:
+        """Characters worth extracting for the active provider (None = all)"""
+        if self.model and self.ai_provider in ('groq', 'gemini'):
+            return LLM_EXTRACT_LIMIT
+        # Rule-based analysis scans the whole document
+        return None
+
+    def _extract_text_cached(self, stream: BinaryIO, filename: str, digest: str, max_chars: Optional[int] = None) -> str:
+        """Extract text once per distinct file content, parser and budget"""
+        path = os.path.join(Config.CACHE_FOLDER, f"{digest}-{file_extension(filename)}-{max_chars or 'all'}.txt")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            _touch_cache_entry(path)
+            return text
+        except OSError:
+            pass
+        
+        text = self.extract_text_stream(stream, filename, max_chars)
+        # Extraction failures come back as text; don't persist them
+        if text and not text.startswith("Error extracting"):
+            try:
+                os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            except OSError as e:
+                print(f"Cache write error: {e}")
+            _prune_cache()
+        return text
+
+    def _build_groq_messages(self, text: str, custom_prompt: str = "", summary_length: str = "Standard") -> List[Dict[str, str]]:
+        """Build the Groq chat messages: static system prompt + per-document user message"""
+        
+        # Incorporate user preferences
+        user_instructions = ""
+        if custom_prompt:
+            user_instructions = f"\nUSER CUSTOM INSTRUCTIONS:\n{custom_prompt}\n(Prioritize these instructions over default behavior)\n"
+            
+        summary_instruction = ""
+        if summary_length == "Brief":
+            summary_instruction = "Keep summaries concise and high-level. Focus on bullet points."
+        elif summary_length == "Detailed":
+            summary_instruction = "Provide in-depth comprehensive summaries and detailed analysis."
+        
+        user_message = GROQ_USER_TMPL.format(
+            summary_length=summary_length,
+            summary_instruction=summary_instruction,
+            user_instructions=user_instructions,
+            text=_slice_for_llm(text, GROQ_TEXT_LIMIT)
+        )
+        return [
+            {"role": "system", "content": GROQ_SYSTEM_PROMPT},
+            {"role": "user", "content": user_message},
+        ]
+
+    def _analyze_with_groq(self, text: str, custom_prompt: str = "", summary_length: str = "Standard") -> Dict[str, Any]:
+        """Analyze using Groq API and generate complete custom HTML/CSS dashboard"""
+        messages = self._build_groq_messages(text, custom_prompt, summary_length)
+        
+        try:
+            # Call Groq API
+            chat_completion = self._call_with_retries(lambda: self.client.chat.completions.create(
+                messages=messages,
+                model=Config.GROQ_MODEL,
+                temperature=0.5,
+                max_tokens=8000,
+            ))
+            return self._groq_html_result(chat_completion.choices[0].message.content, text)
+            
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            print("Falling back to rule-based analysis...")
+            return self._fallback_result(text)
+
+    def _groq_html_result(self, html_content: str, text: str) -> Dict[str, Any]:
+        """Turn Groq's generated HTML into the custom-HTML result Flask expects"""
+        html_content = html_content.strip()
+        
+        # Remove markdown code blocks if present
+        html_content = _FENCE_RE.sub('', html_content)
+        
+        # Return in format expected by Flask
+        return {
+            "html_content": html_content,
+            "is_custom_html": True,
+            "text_content": text # Return text for chat context
+        }
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """Client errors (bad key, bad request) won't succeed on retry; 429 might"""
+        # Groq errors carry status_code; Google API errors carry code
+        status = getattr(error, 'status_code', None)
+        if status is None:
+            status = getattr(error, 'code', None)
+        if not isinstance(status, int):
+            return True
+        return status == 429 or status >= 500
+
+    def _call_with_retries(self, call):
+        """Run an LLM call with exponential backoff (1s, 2s, ...)"""
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == LLM_MAX_ATTEMPTS - 1 or not self._is_retryable(e):
+                    raise
+                print(f"LLM call failed ({e}), retrying in {2 ** attempt}s...")
+                time.sleep(2 ** attempt)
+
+    def chat_with_document(self, text: str, question: str) -> str:
+        """Chat with the document using Groq"""
+        if not self.client:
+            return "AI Chat not available (Groq API key missing)."
+            
+        prompt = CHAT_PROMPT_TMPL.format(text=_slice_for_llm(text, CHAT_TEXT_LIMIT), question=question)
+        try:
+            chat_completion = self._call_with_retries(lambda: self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=Config.GROQ_MODEL,
+                temperature=0.3,
+                max_tokens=1000,
+            ))
+            return chat_completion.choices[0].message.content.strip()
+        except Exception as e:
+            return ChatErrorText(f"Error generating answer: {str(e)}")
+
+    def chat_with_document_stream(self, text: str, question: str):
+        """Chat with the document using Groq, yielding the answer as it is generated"""
+        if not self.client:
+            yield "AI Chat not available (Groq API key missing)."
+            return
+            
+        prompt = CHAT_PROMPT_TMPL.format(text=_slice_for_llm(text, CHAT_TEXT_LIMIT), question=question)
+        try:
+            stream = self._call_with_retries(lambda: self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=Config.GROQ_MODEL,
+                temperature=0.3,
+                max_tokens=1000,
+                stream=True,
+            ))
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            yield ChatErrorText(f"Error generating answer: {str(e)}")
+    
+    def _analyze_with_gemini(self, text: str) -> Dict[str, Any]:
+        """Analyze using Gemini API"""
+        
+        prompt = GEMINI_PROMPT_TMPL.format(text=_slice_for_llm(text, GEMINI_TEXT_LIMIT))
+        
+        try:
+            response = self._call_with_retries(lambda: self.model.generate_content(prompt))
             result_text = response.text.strip()
             
             # Remove markdown code blocks if present
-            result_text = re.sub(r'^```json\s*', '', result_text)
-            result_text = re.sub(r'^```\s*', '', result_text)
-            result_text = re.sub(r'\s*```$', '', result_text)
+            result_text = _FENCE_RE.sub('', result_text)
             
             # Parse JSON
             dashboard_data = json.loads(result_text)
@@ -421,70 +879,58 @@ DOCUMENT TO ANALYZE:
             
         except Exception as e:
             print(f"Gemini API error: {e}")
-            return self._analyze_with_rules(text)
+            return self._fallback_result(text)
     
 
     
-    def _analyze_with_rules(self, text: str) -> Dict[str, Any]:
-        """Fallback rule-based analysis"""
-        
-        # Simple extraction
-        lines = text.split('\n')
-        title = lines[0][:100] if lines else "Document Analysis"
-        
-        # Detect sections
-        sections = []
+    def _iter_sections(self, text: str):
+        """Yield rule-detected dashboard sections in display order"""
         
         # Abstract/Summary
-        abstract_match = re.search(r'(abstract|summary|executive summary)[:\s]+(.*?)(?=\n\n|\Z)', 
-                                   text, re.IGNORECASE | re.DOTALL)
+        abstract_match = _ABSTRACT_RE.search(text)
         if abstract_match:
-            sections.append({
-                "id": "abstract",
-                "title": "Abstract",
-                "content_html": f"<p>{abstract_match.group(2)[:500]}</p>",
-                "chart": None
-            })
+            yield Section("abstract", "Abstract", f"<p>{abstract_match.group(2)[:500]}</p>", None)
         
-        # Extract numbers for a sample chart
-        numbers = re.findall(r'\b\d+\.?\d*\b', text)
+        # Extract numbers for a sample chart (only the first 6 are charted)
+        numbers = [m.group(0) for m in islice(_NUM_RE.finditer(text), 6)]
         if len(numbers) >= 3:
-            chart_data = [float(n) for n in numbers[:6]]
-            sections.append({
-                "id": "metrics",
-                "title": "Key Metrics",
-                "content_html": "<p>Numerical data extracted from the document.</p>",
-                "chart": {
-                    "type": "bar",
-                    "labels": [f"Metric {i+1}" for i in range(len(chart_data))],
-                    "datasets": [{
-                        "label": "Values",
-                        "data": chart_data,
-                        "color": "#0ea5e9"
-                    }]
-                }
+            # numpy parses the match strings in C; tolist() keeps the JSON native
+            chart_data = np.asarray(numbers, dtype=np.float64).tolist()
+            yield Section("metrics", "Key Metrics", "<p>Numerical data extracted from the document.</p>", {
+                "type": "bar",
+                "labels": [f"Metric {i+1}" for i in range(len(chart_data))],
+                "datasets": [{
+                    "label": "Values",
+                    "data": chart_data,
+                    "color": "#0ea5e9"
+                }]
             })
         
         # Conclusion
-        conclusion_match = re.search(r'(conclusion|summary|findings)[:\s]+(.*?)(?=\n\n|\Z)', 
-                                     text, re.IGNORECASE | re.DOTALL)
+        conclusion_match = _CONCLUSION_RE.search(text)
         if conclusion_match:
-            sections.append({
-                "id": "conclusion",
-                "title": "Conclusion",
-                "content_html": f"<p>{conclusion_match.group(2)[:500]}</p>",
-                "chart": None
-            })
+            yield Section("conclusion", "Conclusion", f"<p>{conclusion_match.group(2)[:500]}</p>", None)
+    
+    def _analyze_with_rules(self, text: str) -> Dict[str, Any]:
+        """Fallback rule-based analysis"""
+        
+        # Simple extraction
+        # First line only; avoid splitting (or lowercasing) the whole document
+        newline = text.find('\n', 0, 100)
+        title = text[:newline if newline != -1 else 100]
+        
+        # Detect sections
+        sections = list(self._iter_sections(text))
         
         # Generate export HTML
-        export_html = "<section>"
-        for section in sections:
-            export_html += f"<h2>{section['title']}</h2>{section['content_html']}"
-        export_html += "</section>"
+        parts = ["<section>"]
+        parts.extend(f"<h2>{section.title}</h2>{section.content_html}" for section in sections)
+        parts.append("</section>")
+        export_html = "".join(parts)
         
         return {
             "title": title,
-            "sections": sections,
+            "sections": [section.to_dict() for section in sections],
             "ui_theme": {
                 "primary_color": "#0ea5e9",
                 "accent_color": "#6366f1",
@@ -496,7 +942,19 @@ DOCUMENT TO ANALYZE:
     
     def _generate_word_cloud(self, text: str) -> str:
         """Generate word cloud image and return as base64 string"""
+        if len(text) < MIN_VISUAL_TEXT:
+            return ""
+        
+        key = hashlib.blake2b(text.encode('utf-8', errors='ignore'), digest_size=16).hexdigest()
+        cached = _WORD_CLOUD_CACHE.get(key)
+        if cached is not None:
+            _WORD_CLOUD_CACHE.move_to_end(key)
+            return cached
+        
         try:
+            # Deferred: wordcloud pulls in matplotlib, which most requests never need
+            from wordcloud import WordCloud
+            
             # Create word cloud
             wordcloud = WordCloud(
                 width=800,
@@ -508,80 +966,82 @@ DOCUMENT TO ANALYZE:
                 min_font_size=10
             ).generate(text)
             
-            # Save to buffer
+            # Render straight to PNG via Pillow (no matplotlib figure)
             buffer = io.BytesIO()
-            plt.figure(figsize=(10, 5))
-            plt.imshow(wordcloud, interpolation='bilinear')
-            plt.axis('off')
-            plt.tight_layout(pad=0)
-            plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
-            plt.close()
+            wordcloud.to_image().save(buffer, format='PNG', optimize=False)
             
             # Convert to base64
-            buffer.seek(0)
-            img_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-            return f"data:image/png;base64,{img_base64}"
+            img_base64 = base64.b64encode(buffer.getvalue()).decode('ascii')
+            data_uri = f"data:image/png;base64,{img_base64}"
         except Exception as e:
             print(f"Word cloud generation error: {e}")
             return ""
+        
+        _WORD_CLOUD_CACHE[key] = data_uri
+        if len(_WORD_CLOUD_CACHE) > WORD_CLOUD_CACHE_SIZE:
+            _WORD_CLOUD_CACHE.popitem(last=False)
+        return data_uri
     
     def _extract_tabular_data(self, text: str) -> List[Dict[str, Any]]:
         """Extract tabular data from text for interactive tables"""
+        scan = text[:TABLE_SCAN_LIMIT]
+        # Without any separator there is nothing to tokenize
+        if len(scan) < MIN_VISUAL_TEXT or ('|' not in scan and '\t' not in scan):
+            return []
+        
         tables = []
         
         # Simple pattern matching for table-like structures
         # Look for lines with multiple tab or pipe separators
-        lines = text.split('\n')
         current_table = []
         
-        for line in lines:
+        for line in scan.splitlines():
             # Check if line looks like a table row (has multiple separators)
-            if '|' in line or '\t' in line:
-                # Split by separator
-                if '|' in line:
-                    cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-                else:
-                    cells = [cell.strip() for cell in line.split('\t') if cell.strip()]
-                
+            sep = '|' if '|' in line else ('\t' if '\t' in line else None)
+            if sep:
+                cells = [cell for cell in map(str.strip, line.split(sep)) if cell]
                 if len(cells) >= 2:  # At least 2 columns
                     current_table.append(cells)
             elif current_table:
                 # End of table
-                if len(current_table) >= 2:  # At least header + 1 row
-                    tables.append({
-                        "headers": current_table[0],
-                        "rows": current_table[1:]
-                    })
+                self._flush_table(current_table, tables)
                 current_table = []
         
         # Check for last table
-        if current_table and len(current_table) >= 2:
-            tables.append({
-                "headers": current_table[0],
-                "rows": current_table[1:]
-            })
+        self._flush_table(current_table, tables)
         
         return tables
     
+    @staticmethod
+    def _flush_table(rows: List[List[str]], tables: List[Dict[str, Any]]) -> None:
+        """Append rows to tables if they form a table (header + 1 row)"""
+        if len(rows) >= 2:
+            tables.append({
+                "headers": rows[0],
+                "rows": rows[1:]
+            })
+    
     def _generate_heatmap_data(self, text: str) -> Optional[Dict[str, Any]]:
         """Generate heatmap data from numerical correlations in text"""
+        if len(text) < MIN_VISUAL_TEXT:
+            return None
+        
         try:
             # Extract numbers and their context
             # This is a simplified version - AI will do better job
-            numbers = re.findall(r'\b\d+\.?\d*\b', text)
+            # Only the first 25 numbers can land in the matrix; stop scanning there
+            numbers = [m.group(0) for m in islice(_NUM_RE.finditer(text), HEATMAP_MAX_SIZE ** 2)]
             if len(numbers) < 9:  # Need at least 3x3 matrix
                 return None
             
             # Create a simple correlation matrix
-            size = min(5, int(len(numbers) ** 0.5))  # Max 5x5
-            matrix_data = [float(n) for n in numbers[:size*size]]
-            
-            # Reshape into matrix
-            matrix = np.array(matrix_data).reshape(size, size)
+            size = min(HEATMAP_MAX_SIZE, math.isqrt(len(numbers)))  # Max 5x5
+            # Parse straight into a float array and reshape into matrix
+            matrix = np.asarray(numbers[:size*size], dtype=np.float64).reshape(size, size)
             
             return {
                 "type": "heatmap",
-                "z": matrix.tolist(),
+                "z": _typed_array(matrix.astype('<f4')),
                 "x": [f"Metric {i+1}" for i in range(size)],
                 "y": [f"Category {i+1}" for i in range(size)],
                 "colorscale": "Viridis"
@@ -592,14 +1052,14 @@ DOCUMENT TO ANALYZE:
     
     def _generate_sankey_data(self, text: str) -> Optional[Dict[str, Any]]:
         """Generate Sankey diagram data from flow/transition information"""
+        if len(text) < MIN_VISUAL_TEXT:
+            return None
+        
         # This is a placeholder - AI will generate better data
         # Sankey requires source, target, and value arrays
         try:
             # Look for flow-related keywords
-            flow_keywords = ['from', 'to', 'flow', 'transfer', 'allocation', 'budget']
-            has_flow = any(keyword in text.lower() for keyword in flow_keywords)
-            
-            if not has_flow:
+            if not _FLOW_RE.search(text):
                 return None
             
             # Simple example structure (AI will generate actual data)
@@ -610,9 +1070,9 @@ DOCUMENT TO ANALYZE:
                     "color": ["#0ea5e9", "#6366f1", "#10b981", "#f59e0b"]
                 },
                 "link": {
-                    "source": [0, 0, 1, 1],
-                    "target": [2, 3, 2, 3],
-                    "value": [8, 4, 2, 8]
+                    "source": _typed_array(np.array([0, 0, 1, 1], dtype='<i4')),
+                    "target": _typed_array(np.array([2, 3, 2, 3], dtype='<i4')),
+                    "value": _typed_array(np.array([8, 4, 2, 8], dtype='<i4'))
                 }
             }
         except Exception as e:
@@ -637,3 +1097,17 @@ DOCUMENT TO ANALYZE:
             "export_html": f"<section><h2>Error</h2><p>{error_msg}</p></section>",
             "share_ready": False
         }
+
+
+_default_analyzer: Optional[DocumentAnalyzer] = None
+
+def get_default_analyzer() -> DocumentAnalyzer:
+    """Return the process-wide analyzer, creating it on first use
+    
+    Reusing one instance keeps the provider clients (and their connection
+    pools) alive across requests.
+    """
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = DocumentAnalyzer()
+    return _default_analyzer
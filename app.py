@@ -1,194 +1,520 @@
 import os
+import re
+import mmap
 import json
-import uuid
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
+import time
+import hashlib
+from string import Template
+from functools import lru_cache
+from itertools import islice
+from threading import BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, send_file, Response, stream_with_context, make_response
 from werkzeug.utils import secure_filename
+from markupsafe import escape
 from config import Config
-from analyzer import DocumentAnalyzer
+from analyzer import get_default_analyzer, file_extension, ChatErrorText
+from chat_cache import ChatCache
+from storage import write_atomic, temp_path, create_exclusive
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN
 from io import BytesIO
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 app = Flask(__name__)
 app.config.from_object(Config)
 Config.init_app(app)
 
 # Initialize analyzer
-analyzer = DocumentAnalyzer()
+analyzer = get_default_analyzer()
+
+# Answers to repeated chat questions, per dashboard
+app.chat_cache = ChatCache(
+    Config.DASHBOARD_FOLDER,
+    max_entries=Config.CHAT_CACHE_SIZE,
+    semantic=Config.CHAT_SEMANTIC_CACHE,
+    threshold=Config.CHAT_SEMANTIC_THRESHOLD
+)
+
+# Uploads are analyzed here so a slow LLM call doesn't hold a request worker
+app.analysis_executor = ThreadPoolExecutor(max_workers=Config.ANALYSIS_WORKERS)
+# The executor's queue is unbounded and each job holds its upload in memory
+app.analysis_slots = BoundedSemaphore(Config.ANALYSIS_QUEUE_LIMIT)
+
+# The chat widget is a static script; dashboards only get a one-line tag
+CHAT_WIDGET_JS = 'js/chat_widget.js'
+
+with open(os.path.join(app.static_folder, CHAT_WIDGET_JS), 'rb') as f:
+    # Goes in the script URL and every HTML ETag, so a changed widget busts caches
+    CHAT_WIDGET_VERSION = hashlib.sha1(f.read()).hexdigest()[:8]
+
+# Built once; only the two $-placeholders are filled per request
+CHAT_WIDGET_TAG = Template('<script src="$src" data-dashboard-id="$dashboard_id" defer></script>\n')
+
+def inject_chat_widget(html_content, dashboard_id):
+    """Insert the chat widget script tag before the closing </body> tag"""
+    # Dashboards saved before serve-time injection already contain it
+    if 'id="chat-widget"' in html_content:
+        return html_content
+    widget = CHAT_WIDGET_TAG.substitute(
+        src=url_for('static', filename=CHAT_WIDGET_JS, v=CHAT_WIDGET_VERSION),
+        dashboard_id=escape(dashboard_id),
+    )
+    index = html_content.rfind('</body>')
+    if index == -1:
+        return html_content + widget
+    return html_content[:index] + widget + html_content[index:]
+
+@app.after_request
+def cache_chat_widget(response):
+    """Versioned widget URLs never change, so browsers may keep them for a year"""
+    if request.endpoint == 'static' and request.args.get('v') == CHAT_WIDGET_VERSION:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def html_dashboard_response(html_path, dashboard_id):
+    """Serve a custom HTML dashboard with validators so refreshes can get a 304"""
+    stat = os.stat(html_path)
+    response = make_response(inject_chat_widget(load_text(html_path), dashboard_id))
+    response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{CHAT_WIDGET_VERSION}")
+    response.last_modified = stat.st_mtime
+    return response.make_conditional(request)
+
+# Bound once; avoids a Flask config lookup per upload
+_ALLOWED = frozenset(Config.ALLOWED_EXTENSIONS)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    return '.' in filename and file_extension(filename) in _ALLOWED
+
+def to_json(obj, indent=False):
+    """Serialize to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+def from_json(data):
+    """Parse JSON bytes or text, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def ojsonify(obj):
+    """jsonify() equivalent backed by to_json()"""
+    return Response(to_json(obj), mimetype='application/json')
+
+def request_json():
+    """Parse the request body as a JSON object, or None if it isn't one"""
+    try:
+        data = from_json(request.get_data())
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@lru_cache(maxsize=128)
+def _read_text_cached(path, mtime_ns):
+    """Read a dashboard text file; mtime_ns in the key invalidates rewrites
+    
+    The file is memory-mapped and decoded straight from the page cache,
+    skipping the intermediate bytes copy a buffered read() makes.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return ''
+        with mm:
+            text = str(mm, 'utf-8')
+    # Same newline translation text-mode open() applied
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+@lru_cache(maxsize=128)
+def _read_json_cached(path, mtime_ns):
+    """Parse a dashboard JSON file once per file version (treat as read-only)"""
+    with open(path, 'rb') as f:
+        return from_json(f.read())
+
+def load_text(path):
+    """Return a dashboard text file's contents, from memory when unchanged"""
+    return _read_text_cached(path, os.stat(path).st_mtime_ns)
+
+def load_json(path):
+    """Return a dashboard JSON file's parsed contents, from memory when unchanged"""
+    return _read_json_cached(path, os.stat(path).st_mtime_ns)
 
 @app.route('/')
 def index():
     """Landing page with upload interface"""
     return render_template('index.html')
 
+def save_dashboard(unique_id, dashboard_data):
+    """Persist analysis output (chat text + HTML or JSON dashboard)"""
+    
+    # Save extracted text for chat context
+    if 'text_content' in dashboard_data:
+        text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.txt")
+        write_atomic(text_path, dashboard_data['text_content'].encode('utf-8'))
+        # Precompute the PowerPoint export while the text is in hand
+        try:
+            save_pptx(unique_id, dashboard_data['text_content'])
+        except Exception as e:
+            # /export/pptx rebuilds on demand
+            print(f"PPTX precompute error: {e}")
+    
+    # Check if it's custom HTML or JSON format
+    if dashboard_data.get('is_custom_html'):
+        html_content = dashboard_data['html_content']
+        # Save HTML untouched; the chat widget is injected when served
+        html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.html")
+        write_atomic(html_path, html_content.encode('utf-8'))
+        remove_file(dashboard_file(unique_id, '.json'))
+    else:
+        # Save dashboard JSON (fallback)
+        dashboard_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.json")
+        write_atomic(dashboard_path, to_json(dashboard_data))
+        remove_file(dashboard_file(unique_id, '.html'))
+    
+    # Fallback results (API errors, rule-based stand-ins) are redone on the next identical upload
+    if analyzer.is_cacheable(dashboard_data):
+        remove_file(dashboard_file(unique_id, '.retry'))
+    else:
+        write_atomic(dashboard_file(unique_id, '.retry'), b'')
+
+def dashboard_file(dashboard_id, suffix):
+    """Path of a stored dashboard artifact (.html, .json, .txt, .err, .pending, .retry)"""
+    return os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}{suffix}")
+
+def remove_file(path):
+    """Delete a file if present"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Content-hash ids, plus uuid4 ids from dashboards stored before hashing
+_DASHBOARD_ID_RE = re.compile(r'[0-9a-f]{32}|[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}')
+
+def valid_dashboard_id(dashboard_id):
+    """True for ids this app generates; anything else could escape DASHBOARD_FOLDER"""
+    return isinstance(dashboard_id, str) and _DASHBOARD_ID_RE.fullmatch(dashboard_id) is not None
+
+def upload_dashboard_id(digest, filename, custom_prompt, summary_length):
+    """Content-derived dashboard id; identical uploads with identical options share one
+    
+    `digest` is the upload's SHA-256 hex digest, which the analyzer reuses as
+    its cache key, so the bytes are only hashed once. The extension picks the
+    parser, so it is part of the id too.
+    """
+    h = hashlib.sha256(digest.encode('ascii'))
+    for part in (file_extension(filename), custom_prompt, summary_length, analyzer.analysis_mode, Config.GROQ_MODEL):
+        h.update(b'\0')
+        h.update(part.encode('utf-8'))
+    return h.hexdigest()[:32]
+
+def pending_active(dashboard_id):
+    """True while a .pending marker exists and isn't older than ANALYSIS_STALE_AFTER"""
+    try:
+        age = time.time() - os.path.getmtime(dashboard_file(dashboard_id, '.pending'))
+    except OSError:
+        return False
+    return age < Config.ANALYSIS_STALE_AFTER
+
+def claim_pending(dashboard_id):
+    """Create the `.pending` marker for a new analysis; False if one is already running
+    
+    The marker holds its creation time and process id. A stale one, left by
+    a worker that died mid-analysis, is replaced instead of blocking forever.
+    """
+    pending_path = dashboard_file(dashboard_id, '.pending')
+    owner = f"{time.time():.0f} {os.getpid()}".encode('ascii')
+    if create_exclusive(pending_path, owner):
+        return True
+    if pending_active(dashboard_id):
+        return False
+    remove_file(pending_path)
+    return create_exclusive(pending_path, owner)
+
+def reusable_dashboard(dashboard_id):
+    """True when a finished dashboard exists and isn't flagged for re-analysis"""
+    if os.path.exists(dashboard_file(dashboard_id, '.retry')):
+        return False
+    return os.path.exists(dashboard_file(dashboard_id, '.html')) or os.path.exists(dashboard_file(dashboard_id, '.json'))
+
+def run_analysis(unique_id, stream, filename, custom_prompt, summary_length, digest):
+    """Background job: analyze an upload and save its dashboard
+    
+    Failures are recorded in `{id}.err` for /api/status to report; the
+    `{id}.pending` marker and the job's analysis slot are released either way.
+    """
+    try:
+        dashboard_data = analyzer.analyze_document_stream(stream, filename, custom_prompt, summary_length, digest)
+        save_dashboard(unique_id, dashboard_data)
+    except Exception as e:
+        print(f"Analysis failed for {unique_id}: {e}")
+        write_atomic(dashboard_file(unique_id, '.err'), f'Analysis failed: {str(e)}'.encode('utf-8'))
+    finally:
+        remove_file(dashboard_file(unique_id, '.pending'))
+        app.analysis_slots.release()
+
+@app.errorhandler(413)
+def file_too_large(e):
+    """Reject oversized uploads before the body is buffered"""
+    return ojsonify({'error': f"File too large. Maximum size is {app.config['MAX_FILE_SIZE'] // (1024 * 1024)}MB"}), 413
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and analysis"""
     
     # Check if file is present
     if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+        return ojsonify({'error': 'No file provided'}), 400
     
     file = request.files['file']
     
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return ojsonify({'error': 'No file selected'}), 400
     
     if not allowed_file(file.filename):
-        return jsonify({'error': 'Invalid file type. Allowed: PDF, DOCX, TXT'}), 400
+        return ojsonify({'error': 'Invalid file type. Allowed: PDF, DOCX, TXT'}), 400
     
     try:
-        # Save file
         filename = secure_filename(file.filename)
-        unique_id = str(uuid.uuid4())
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
-        file.save(file_path)
         
         # Get options
         custom_prompt = request.form.get('custom_prompt', '')
         summary_length = request.form.get('summary_length', 'Standard')
         
-        # Analyze document
-        dashboard_data = analyzer.analyze_document(file_path, custom_prompt, summary_length)
-        
-        # Save extracted text for chat context
-        if 'text_content' in dashboard_data:
-            text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.txt")
-            with open(text_path, 'w', encoding='utf-8') as f:
-                f.write(dashboard_data['text_content'])
+        # The request's stream is closed once we return, so the job gets an in-memory copy
+        data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        unique_id = upload_dashboard_id(digest, filename, custom_prompt, summary_length)
+        status_url = url_for('dashboard_status', dashboard_id=unique_id)
         
-        # Check if it's custom HTML or JSON format
-        if dashboard_data.get('is_custom_html'):
-            # Inject Chat Widget
-            html_content = dashboard_data['html_content']
-            chat_widget_code = f"""
-            <!-- Chat Widget -->
-            <div id="chat-widget" style="position: fixed; bottom: 20px; right: 20px; z-index: 9999; font-family: system-ui, -apple-system, sans-serif;">
-                <button id="chat-toggle" onclick="toggleChat()" style="background: #000; color: white; border: none; padding: 15px; border-radius: 50%; cursor: pointer; box-shadow: 0 4px 12px rgba(0,0,0,0.15); width: 60px; height: 60px; display: flex; align-items: center; justify-content: center; transition: transform 0.2s;">
-                    <svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"></path></svg>
-                </button>
-                <div id="chat-window" style="display: none; position: absolute; bottom: 80px; right: 0; width: 350px; height: 500px; background: white; border-radius: 12px; box-shadow: 0 5px 20px rgba(0,0,0,0.2); flex-direction: column; overflow: hidden; border: 1px solid #eee;">
-                    <div style="padding: 15px; background: #f8f9fa; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
-                        <h3 style="margin: 0; font-size: 16px; font-weight: 600;">Chat with Document</h3>
-                        <button onclick="toggleChat()" style="background: none; border: none; cursor: pointer; font-size: 18px;">&times;</button>
-                    </div>
-                    <div id="chat-messages" style="flex: 1; padding: 15px; overflow-y: auto; background: #fff;">
-                        <div style="margin-bottom: 10px; color: #666; font-size: 14px;">Ask me anything about this document!</div>
-                    </div>
-                    <div style="padding: 15px; border-top: 1px solid #eee; display: flex; gap: 10px;">
-                        <input type="text" id="chat-input" placeholder="Type a question..." style="flex: 1; padding: 10px; border: 1px solid #ddd; border-radius: 6px; outline: none;" onkeypress="handleKeyPress(event)">
-                        <button onclick="sendMessage()" style="background: #000; color: white; border: none; padding: 10px 15px; border-radius: 6px; cursor: pointer;">Send</button>
-                    </div>
-                </div>
-            </div>
-            <script>
-                const DASHBOARD_ID = "{unique_id}";
-                function toggleChat() {{
-                    const w = document.getElementById('chat-window');
-                    const b = document.getElementById('chat-toggle');
-                    if (w.style.display === 'none') {{
-                        w.style.display = 'flex';
-                        b.style.transform = 'scale(0.9)';
-                    }} else {{
-                        w.style.display = 'none';
-                        b.style.transform = 'scale(1)';
-                    }}
-                }}
-                function handleKeyPress(e) {{
-                    if (e.key === 'Enter') sendMessage();
-                }}
-                async function sendMessage() {{
-                    const input = document.getElementById('chat-input');
-                    const msgs = document.getElementById('chat-messages');
-                    const text = input.value.trim();
-                    if (!text) return;
-                    
-                    // Add user message
-                    msgs.innerHTML += `<div style="margin: 10px 0; text-align: right;"><span style="background: #000; color: white; padding: 8px 12px; border-radius: 12px 12px 0 12px; display: inline-block; font-size: 14px;">${{text}}</span></div>`;
-                    input.value = '';
-                    msgs.scrollTop = msgs.scrollHeight;
-                    
-                    // Add loading
-                    const loadingId = 'loading-' + Date.now();
-                    msgs.innerHTML += `<div id="${{loadingId}}" style="margin: 10px 0; text-align: left;"><span style="background: #f1f1f1; color: #333; padding: 8px 12px; border-radius: 12px 12px 12px 0; display: inline-block; font-size: 14px;">Thinking...</span></div>`;
-                    msgs.scrollTop = msgs.scrollHeight;
-                    
-                    try {{
-                        const res = await fetch('/api/chat', {{
-                            method: 'POST',
-                            headers: {{ 'Content-Type': 'application/json' }},
-                            body: JSON.stringify({{ dashboard_id: DASHBOARD_ID, message: text }})
-                        }});
-                        const data = await res.json();
-                        
-                        // Remove loading and add response
-                        document.getElementById(loadingId).remove();
-                        msgs.innerHTML += `<div style="margin: 10px 0; text-align: left;"><span style="background: #f1f1f1; color: #333; padding: 8px 12px; border-radius: 12px 12px 12px 0; display: inline-block; font-size: 14px;">${{data.response}}</span></div>`;
-                    }} catch (e) {{
-                        document.getElementById(loadingId).remove();
-                        msgs.innerHTML += `<div style="margin: 10px 0; text-align: left; color: red;">Error: ${{e.message}}</div>`;
-                    }}
-                    msgs.scrollTop = msgs.scrollHeight;
-                }}
-            </script>
-            """
-            
-            # Insert before </body>
-            if '</body>' in html_content:
-                html_content = html_content.replace('</body>', f'{chat_widget_code}</body>')
-            else:
-                html_content += chat_widget_code
-            
-            # Save HTML directly
-            html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.html")
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-        else:
-            # Save dashboard JSON (fallback)
-            dashboard_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{unique_id}.json")
-            with open(dashboard_path, 'w', encoding='utf-8') as f:
-                json.dump(dashboard_data, f, indent=2)
+        # Same document and options as an earlier upload: reuse its dashboard
+        if reusable_dashboard(unique_id):
+            return ojsonify({
+                'success': True,
+                'dashboard_id': unique_id,
+                'status': 'ready',
+                'status_url': status_url,
+                'redirect': url_for('dashboard', dashboard_id=unique_id)
+            })
         
-        # Clean up uploaded file
-        os.remove(file_path)
+        # Otherwise an identical upload is already being analyzed; share its job
+        if claim_pending(unique_id):
+            if not app.analysis_slots.acquire(blocking=False):
+                remove_file(dashboard_file(unique_id, '.pending'))
+                return ojsonify({'error': 'Server busy, please try again shortly'}), 503, {'Retry-After': '30'}
+            remove_file(dashboard_file(unique_id, '.err'))
+            try:
+                app.analysis_executor.submit(run_analysis, unique_id, BytesIO(data), filename, custom_prompt, summary_length, digest)
+            except Exception:
+                app.analysis_slots.release()
+                remove_file(dashboard_file(unique_id, '.pending'))
+                raise
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'dashboard_id': unique_id,
-            'is_custom_html': dashboard_data.get('is_custom_html', False),
-            'redirect': url_for('dashboard', dashboard_id=unique_id)
-        })
+            'status': 'processing',
+            'status_url': status_url
+        }), 202
     
     except Exception as e:
-        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+        return ojsonify({'error': f'Analysis failed: {str(e)}'}), 500
+
+@app.route('/api/status/<dashboard_id>')
+def dashboard_status(dashboard_id):
+    """Report a background analysis as processing, ready or error"""
+    
+    # Checked first: a re-analysis may be running over an older dashboard
+    if pending_active(dashboard_id):
+        return ojsonify({'status': 'processing'})
+    
+    if os.path.exists(dashboard_file(dashboard_id, '.html')) or os.path.exists(dashboard_file(dashboard_id, '.json')):
+        return ojsonify({
+            'status': 'ready',
+            'dashboard_id': dashboard_id,
+            'redirect': url_for('dashboard', dashboard_id=dashboard_id)
+        })
+    
+    err_path = dashboard_file(dashboard_id, '.err')
+    if os.path.exists(err_path):
+        return ojsonify({'status': 'error', 'error': load_text(err_path)})
+    
+    # The job's worker died before recording a result
+    if os.path.exists(dashboard_file(dashboard_id, '.pending')):
+        return ojsonify({'status': 'error', 'error': 'Analysis did not finish. Please upload the file again.'})
+    
+    return ojsonify({'error': 'Dashboard not found'}), 404
+
+@app.route('/upload/stream', methods=['POST'])
+def upload_file_stream():
+    """Handle file upload and stream the generated dashboard HTML (SSE)
+    
+    Emits `data: {"delta": ...}` events as Groq generates the page, then an
+    `event: done` carrying the same payload /upload returns as JSON. An
+    `event: reset` before `done` means the streamed HTML should be discarded.
+    If the same upload is already being analyzed, the only event is
+    `event: pending` with a `status_url` to poll, as /upload returns.
+    """
+    
+    if 'file' not in request.files:
+        return ojsonify({'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return ojsonify({'error': 'No file selected'}), 400
+    
+    if not allowed_file(file.filename):
+        return ojsonify({'error': 'Invalid file type. Allowed: PDF, DOCX, TXT'}), 400
+    
+    filename = secure_filename(file.filename)
+    
+    custom_prompt = request.form.get('custom_prompt', '')
+    summary_length = request.form.get('summary_length', 'Standard')
+    
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    unique_id = upload_dashboard_id(digest, filename, custom_prompt, summary_length)
+    status_url = url_for('dashboard_status', dashboard_id=unique_id)
+    
+    def generate():
+        claimed = False
+        try:
+            # Same document and options as an earlier upload: reuse its dashboard
+            if reusable_dashboard(unique_id):
+                done = {
+                    'success': True,
+                    'dashboard_id': unique_id,
+                    'is_custom_html': os.path.exists(dashboard_file(unique_id, '.html')),
+                    'redirect': url_for('dashboard', dashboard_id=unique_id)
+                }
+                yield f"event: done\ndata: {to_json(done).decode()}\n\n"
+                return
+            
+            if not claim_pending(unique_id):
+                pending = {
+                    'success': True,
+                    'dashboard_id': unique_id,
+                    'status': 'processing',
+                    'status_url': status_url
+                }
+                yield f"event: pending\ndata: {to_json(pending).decode()}\n\n"
+                return
+            claimed = True
+            remove_file(dashboard_file(unique_id, '.err'))
+            
+            for event in analyzer.iter_dashboard_stream(BytesIO(data), filename, custom_prompt, summary_length, digest):
+                if 'delta' in event:
+                    yield f"data: {to_json({'delta': event['delta']}).decode()}\n\n"
+                    continue
+                if 'reset' in event:
+                    # Streamed HTML so far should be discarded
+                    yield f"event: reset\ndata: {to_json({'error': event['reset']}).decode()}\n\n"
+                    continue
+                
+                dashboard_data = event['result']
+                save_dashboard(unique_id, dashboard_data)
+                done = {
+                    'success': True,
+                    'dashboard_id': unique_id,
+                    'is_custom_html': dashboard_data.get('is_custom_html', False),
+                    'redirect': url_for('dashboard', dashboard_id=unique_id)
+                }
+                yield f"event: done\ndata: {to_json(done).decode()}\n\n"
+        except Exception as e:
+            if claimed:
+                # Uploads polling this id's status see the failure too
+                write_atomic(dashboard_file(unique_id, '.err'), f'Analysis failed: {str(e)}'.encode('utf-8'))
+            yield f"event: error\ndata: {to_json({'error': f'Analysis failed: {str(e)}'}).decode()}\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream
+            if claimed:
+                remove_file(dashboard_file(unique_id, '.pending'))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/chat', methods=['POST'])
 def chat_api():
     """Handle chat requests"""
-    data = request.json
+    data = request_json()
+    if data is None:
+        return ojsonify({'error': 'Invalid JSON'}), 400
     dashboard_id = data.get('dashboard_id')
     message = data.get('message')
     
     if not dashboard_id or not message:
-        return jsonify({'error': 'Missing data'}), 400
+        return ojsonify({'error': 'Missing data'}), 400
+    if not valid_dashboard_id(dashboard_id):
+        return ojsonify({'error': 'Invalid dashboard id'}), 400
         
     # Load document text
     text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.txt")
-    if not os.path.exists(text_path):
-        return jsonify({'error': 'Document context not found'}), 404
+    try:
+        # Usually an in-memory hit; a missing file means an unknown dashboard
+        text = load_text(text_path)
+    except FileNotFoundError:
+        return ojsonify({'error': 'Document context not found'}), 404
         
-    with open(text_path, 'r', encoding='utf-8') as f:
-        text = f.read()
+    cached = app.chat_cache.get(dashboard_id, message)
+    if cached is not None:
+        return ojsonify({'response': cached})
         
     # Generate response
     response = analyzer.chat_with_document(text, message)
-    return jsonify({'response': response})
+    if analyzer.client and not isinstance(response, ChatErrorText):
+        app.chat_cache.put(dashboard_id, message, response)
+    return ojsonify({'response': response})
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_api():
+    """Handle chat requests, streaming the answer as Server-Sent Events"""
+    data = request_json()
+    if data is None:
+        return ojsonify({'error': 'Invalid JSON'}), 400
+    dashboard_id = data.get('dashboard_id')
+    message = data.get('message')
+    
+    if not dashboard_id or not message:
+        return ojsonify({'error': 'Missing data'}), 400
+    if not valid_dashboard_id(dashboard_id):
+        return ojsonify({'error': 'Invalid dashboard id'}), 400
+        
+    # Load document text
+    text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.txt")
+    try:
+        text = load_text(text_path)
+    except FileNotFoundError:
+        return ojsonify({'error': 'Document context not found'}), 404
+    
+    cached = app.chat_cache.get(dashboard_id, message)
+    
+    def generate():
+        if cached is not None:
+            yield f"data: {to_json({'delta': cached}).decode()}\n\n"
+            return
+        
+        parts = []
+        failed = False
+        for delta in analyzer.chat_with_document_stream(text, message):
+            failed = failed or isinstance(delta, ChatErrorText)
+            parts.append(delta)
+            yield f"data: {to_json({'delta': delta}).decode()}\n\n"
+        
+        if analyzer.client and not failed:
+            app.chat_cache.put(dashboard_id, message, "".join(parts))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/dashboard/<dashboard_id>')
 def dashboard(dashboard_id):
@@ -196,20 +522,20 @@ def dashboard(dashboard_id):
     
     # Check for custom HTML first
     html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.html")
-    if os.path.exists(html_path):
-        # Serve custom HTML directly
-        with open(html_path, 'r', encoding='utf-8') as f:
-            return f.read()
+    try:
+        # Serve custom HTML with the chat widget
+        return html_dashboard_response(html_path, dashboard_id)
+    except FileNotFoundError:
+        pass
     
     # Fallback to JSON template
     dashboard_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.json")
     
-    if not os.path.exists(dashboard_path):
+    try:
+        dashboard_data = load_json(dashboard_path)
+    except FileNotFoundError:
         return "Dashboard not found", 404
     
-    with open(dashboard_path, 'r', encoding='utf-8') as f:
-        dashboard_data = json.load(f)
-    
     return render_template('dashboard.html', 
                          dashboard=dashboard_data, 
                          dashboard_id=dashboard_id)
@@ -220,20 +546,20 @@ def export_dashboard(dashboard_id):
     
     # Check for custom HTML first
     html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.html")
-    if os.path.exists(html_path):
-        # Serve custom HTML directly
-        with open(html_path, 'r', encoding='utf-8') as f:
-            return f.read()
+    try:
+        # Serve custom HTML with the chat widget
+        return html_dashboard_response(html_path, dashboard_id)
+    except FileNotFoundError:
+        pass
     
     # Fallback to JSON template
     dashboard_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.json")
     
-    if not os.path.exists(dashboard_path):
+    try:
+        dashboard_data = load_json(dashboard_path)
+    except FileNotFoundError:
         return "Dashboard not found", 404
     
-    with open(dashboard_path, 'r', encoding='utf-8') as f:
-        dashboard_data = json.load(f)
-    
     return render_template('export.html', dashboard=dashboard_data)
 
 @app.route('/api/dashboard/<dashboard_id>')
@@ -242,28 +568,27 @@ def get_dashboard_json(dashboard_id):
     
     dashboard_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.json")
     
-    if not os.path.exists(dashboard_path):
-        return jsonify({'error': 'Dashboard not found'}), 404
-    
-    with open(dashboard_path, 'r', encoding='utf-8') as f:
-        dashboard_data = json.load(f)
-    
-    return jsonify(dashboard_data)
+    try:
+        if request.args.get('pretty') == '1':
+            # Stored compact; re-serialize indented for human readers
+            return Response(to_json(load_json(dashboard_path), indent=True), mimetype='application/json')
+        # Stream the stored file with ETag/Last-Modified; unchanged -> 304
+        return send_file(os.path.abspath(dashboard_path), mimetype='application/json', conditional=True)
+    except FileNotFoundError:
+        return ojsonify({'error': 'Dashboard not found'}), 404
 
-@app.route('/export/pptx/<dashboard_id>')
-def export_pptx(dashboard_id):
-    """Export dashboard as PowerPoint presentation"""
-    
-    # Check for custom HTML first
-    html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.html")
-    text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.txt")
-    
-    if not os.path.exists(text_path):
-        return "Dashboard not found", 404
-    
-    # Read document text
-    with open(text_path, 'r', encoding='utf-8') as f:
-        text = f.read()
+PPTX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# A run of non-empty lines, i.e. one blank-line separated paragraph
+_PARAGRAPH_RE = re.compile(r'[^\n]+(?:\n[^\n]+)*')
+
+def first_paragraphs(text, n):
+    """Return the first n non-blank paragraphs, scanning no further than needed"""
+    stripped = (m.group(0).strip() for m in _PARAGRAPH_RE.finditer(text))
+    return list(islice((p for p in stripped if p), n))
+
+def build_pptx(text):
+    """Build the summary PowerPoint for a document"""
     
     # Create PowerPoint presentation
     prs = Presentation()
@@ -277,7 +602,9 @@ def export_pptx(dashboard_id):
     subtitle = slide.placeholders[1]
     
     # Extract title from text (first line or first 100 chars)
-    doc_title = text.split('\n')[0][:100] if text else "Research Dashboard"
+    # Only the first 100 characters can matter, so search no further
+    nl = text.find('\n', 0, 100)
+    doc_title = text[:nl if nl != -1 else 100] or "Research Dashboard"
     title.text = doc_title
     subtitle.text = "Generated Dashboard Report"
     
@@ -295,7 +622,7 @@ def export_pptx(dashboard_id):
     tf.text = "Key Highlights:"
     
     # Extract first few paragraphs
-    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()][:5]
+    paragraphs = first_paragraphs(text, 6)
     for para in paragraphs[:3]:
         p = tf.add_paragraph()
         p.text = para[:200] + "..." if len(para) > 200 else para
@@ -319,18 +646,51 @@ def export_pptx(dashboard_id):
         p.text = para[:200] + "..." if len(para) > 200 else para
         p.level = 1
     
-    # Save to BytesIO
-    pptx_io = BytesIO()
-    prs.save(pptx_io)
-    pptx_io.seek(0)
-    
+    return prs
+
+def save_pptx(dashboard_id, text):
+    """Build and store `{id}.pptx` so exports are served from disk"""
+    pptx_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.pptx")
+    # python-pptx writes the zip straight to disk; no in-memory copy of the deck
+    tmp_path = temp_path(pptx_path)
+    try:
+        build_pptx(text).save(tmp_path)
+        os.replace(tmp_path, pptx_path)
+    except BaseException:
+        remove_file(tmp_path)
+        raise
+    return pptx_path
+
+def send_pptx(pptx_path, dashboard_id):
+    """Send a stored deck as a download; raises FileNotFoundError if absent"""
     return send_file(
-        pptx_io,
-        mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        os.path.abspath(pptx_path),
+        mimetype=PPTX_MIMETYPE,
         as_attachment=True,
-        download_name=f'dashboard_{dashboard_id}.pptx'
+        download_name=f'dashboard_{dashboard_id}.pptx',
+        conditional=True
     )
 
+@app.route('/export/pptx/<dashboard_id>')
+def export_pptx(dashboard_id):
+    """Export dashboard as PowerPoint presentation"""
+    
+    pptx_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.pptx")
+    text_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.txt")
+    
+    try:
+        return send_pptx(pptx_path, dashboard_id)
+    except FileNotFoundError:
+        pass
+    
+    try:
+        text = load_text(text_path)
+    except FileNotFoundError:
+        return "Dashboard not found", 404
+    
+    # Dashboards saved before PPTX precomputation are built once, then cached
+    return send_pptx(save_pptx(dashboard_id, text), dashboard_id)
+
 
 
 # PDF Export Route (Optional - requires wkhtmltopdf)
@@ -342,10 +702,10 @@ def export_pdf(dashboard_id):
         
         # Check for custom HTML first
         html_path = os.path.join(app.config['DASHBOARD_FOLDER'], f"{dashboard_id}.html")
-        if os.path.exists(html_path):
+        try:
             with open(html_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
-        else:
+        except FileNotFoundError:
             return "Dashboard not found", 404
             
         # Configure pdfkit
@@ -373,4 +733,7 @@ def export_pdf(dashboard_id):
         return f"PDF export failed: {str(e)}", 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; production runs under gunicorn (see gunicorn_conf.py)
+    # Parsed explicitly: FLASK_DEV=0 must not enable the debugger on 0.0.0.0
+    debug = os.getenv('FLASK_DEV', '').lower() in ('1', 'true', 'yes')
+    app.run(debug=debug, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+import numpy as np
+from storage import write_atomic
+
+class ChatCache:
+    """Caches chat answers per dashboard so repeated questions skip the LLM
+
+    Tier 1 is an exact match on the normalized question, bounded to
+    `max_entries` answers overall (oldest evicted first) and persisted to
+    `{dashboard_id}.chat.json` so it survives restarts. Tier 2, enabled with
+    `semantic=True`, embeds questions with sentence-transformers and reuses
+    an answer when cosine similarity reaches `threshold`. Each vector belongs
+    to a tier-1 entry and is evicted with it.
+    """
+
+    def __init__(self, folder: str, max_entries: int = 1024, semantic: bool = False,
+                 threshold: float = 0.95, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self.model_name = model_name
+        self._answers: Dict[str, "OrderedDict[str, str]"] = {}
+        self._order: deque = deque()
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}
+        self._encoder = None
+        self._lock = threading.Lock()
+        # Separate from _lock: loading the model must not stall exact-match lookups
+        self._encoder_lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(message: str) -> str:
+        return " ".join(message.lower().split())
+
+    def _path(self, dashboard_id: str) -> str:
+        return os.path.join(self.folder, f"{dashboard_id}.chat.json")
+
+    def _entries(self, dashboard_id: str) -> "OrderedDict[str, str]":
+        """Answers for a dashboard, loading persisted ones on first use"""
+        entries = self._answers.get(dashboard_id)
+        if entries is None:
+            entries = OrderedDict()
+            try:
+                with open(self._path(dashboard_id), 'r', encoding='utf-8') as f:
+                    entries.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+            self._answers[dashboard_id] = entries
+            self._order.extend((dashboard_id, question) for question in entries)
+            for evicted_id in self._evict():
+                self._persist(evicted_id)
+            # Eviction may have emptied and forgotten this dashboard; put() still needs it
+            self._answers.setdefault(dashboard_id, entries)
+        return entries
+
+    def _evict(self) -> set:
+        """Drop the oldest answers past max_entries; returns the dashboards touched"""
+        touched = set()
+        while len(self._order) > self.max_entries:
+            dashboard_id, question = self._order.popleft()
+            self._answers.get(dashboard_id, {}).pop(question, None)
+            self._vectors.get(dashboard_id, {}).pop(question, None)
+            touched.add(dashboard_id)
+        return touched
+
+    def _persist(self, dashboard_id: str) -> None:
+        """Write a dashboard's answers to disk, or forget it once none are left
+
+        Evictions are written too, so evicted answers don't return on restart.
+        """
+        entries = self._answers.get(dashboard_id)
+        try:
+            if entries:
+                write_atomic(self._path(dashboard_id), json.dumps(entries).encode('utf-8'))
+                return
+            self._answers.pop(dashboard_id, None)
+            self._vectors.pop(dashboard_id, None)
+            os.remove(self._path(dashboard_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Chat cache write error: {e}")
+
+    def _encode(self, message: str) -> Optional[np.ndarray]:
+        """Embed a question; call without holding _lock"""
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        self._encoder = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        print(f"Semantic chat cache disabled: {e}")
+                        self.semantic = False
+                        return None
+        return self._encoder.encode(message, normalize_embeddings=True)
+
+    def get(self, dashboard_id: str, message: str) -> Optional[str]:
+        """Return a cached answer for the question, or None on miss"""
+        question = self._normalize(message)
+        with self._lock:
+            entries = self._entries(dashboard_id)
+            if not entries:
+                # Nothing cached; don't hold an empty dict per dashboard asked about
+                self._answers.pop(dashboard_id, None)
+            answer = entries.get(question)
+            if answer is not None or not self.semantic or not self._vectors.get(dashboard_id):
+                return answer
+
+        query = self._encode(question)
+        if query is None:
+            return None
+        with self._lock:
+            vectors = self._vectors.get(dashboard_id)
+            if not vectors:
+                return None
+            questions = list(vectors)
+            scores = np.stack(list(vectors.values())) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            return self._answers.get(dashboard_id, {}).get(questions[best])
+
+    def put(self, dashboard_id: str, message: str, answer: str) -> None:
+        """Store an answer and persist the dashboard's exact-match answers"""
+        question = self._normalize(message)
+        # Embedding (and the first-use model load) happens outside the lock
+        vector = self._encode(question) if self.semantic else None
+        with self._lock:
+            entries = self._entries(dashboard_id)
+            if question not in entries:
+                self._order.append((dashboard_id, question))
+            entries[question] = answer
+            if vector is not None:
+                self._vectors.setdefault(dashboard_id, {})[question] = vector
+
+            for evicted_id in self._evict() | {dashboard_id}:
+                self._persist(evicted_id)
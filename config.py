@@ -13,6 +13,7 @@ class Config:
     # Upload settings
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 16777216))  # 16MB default
+    MAX_CONTENT_LENGTH = MAX_FILE_SIZE  # Flask rejects larger requests with 413 before parsing
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'doc'}
     
     # AI settings
@@ -21,12 +22,33 @@ class Config:
     GROQ_MODEL = os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
     
+    # Background analysis jobs started by /upload
+    ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', os.cpu_count() or 4))
+    # Jobs queued or running per process; each keeps its upload in memory,
+    # so /upload answers 503 past this instead of buffering without limit
+    ANALYSIS_QUEUE_LIMIT = int(os.getenv('ANALYSIS_QUEUE_LIMIT', 16))
+    # A job's .pending marker older than this (seconds) is treated as abandoned,
+    # e.g. after a worker was killed mid-analysis, and the upload is redone
+    ANALYSIS_STALE_AFTER = int(os.getenv('ANALYSIS_STALE_AFTER', 900))
+    
     # Dashboard storage
     DASHBOARD_FOLDER = 'dashboards'
     
+    # Chat answer cache (exact match always; semantic match needs sentence-transformers)
+    CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', 1024))
+    CHAT_SEMANTIC_CACHE = os.getenv('CHAT_SEMANTIC_CACHE', 'false').lower() == 'true'
+    CHAT_SEMANTIC_THRESHOLD = float(os.getenv('CHAT_SEMANTIC_THRESHOLD', 0.95))
+    
+    # Analysis cache (extracted text + results, keyed by file content hash)
+    CACHE_FOLDER = os.getenv('CACHE_FOLDER', '.cache')
+    # Least recently used entries are pruned past either cap
+    CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', 256))
+    CACHE_MAX_AGE_DAYS = int(os.getenv('CACHE_MAX_AGE_DAYS', 30))
+    
     @staticmethod
     def init_app(app):
         """Initialize application with config"""
         # Create necessary folders
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(Config.DASHBOARD_FOLDER, exist_ok=True)
+        os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
@@ -0,0 +1,36 @@
+"""Gunicorn settings for production
+
+    gunicorn -c gunicorn_conf.py app:app
+
+Analysis and chat spend most of their time waiting on the LLM API, so
+gevent workers (which monkey-patch sockets and threading on start) let each
+process hold many requests open at once.
+
+Every worker process gets its own analysis executor, text caches and chat
+cache. Under gevent the executor's threads are greenlets, so text extraction
+still runs on the worker's one OS thread; keep ANALYSIS_WORKERS small and
+scale with WEB_CONCURRENCY instead. A dashboard's .chat.json is read once
+per process and rewritten whole by whichever process last cached an answer,
+so processes can miss (or drop from the file) each other's cached answers;
+that only costs an extra LLM call.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+# gevent handles concurrency inside a process; one per CPU is enough
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Read by config.py when each worker imports the app; the CPU-count default
+# suits the single-process dev server, not one executor per worker
+os.environ.setdefault('ANALYSIS_WORKERS', '2')
+
+# Streaming uploads and chat answers can run past the default 30s
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
@@ -10,4 +10,5 @@ echo http://localhost:5000
 echo.
 echo Press Ctrl+C to stop the server
 echo.
+set FLASK_DEV=1
 python app.py
@@ -0,0 +1,111 @@
+// Chat widget for generated dashboards
+// Loaded with: <script src="/static/js/chat_widget.js" data-dashboard-id="..." defer></script>
+(function () {
+    const DASHBOARD_ID = document.currentScript.dataset.dashboardId;
+
+    const WIDGET_HTML = `
+<div id="chat-widget" style="position: fixed; bottom: 20px; right: 20px; z-index: 9999; font-family: system-ui, -apple-system, sans-serif;">
+    <button id="chat-toggle" style="background: #000; color: white; border: none; padding: 15px; border-radius: 50%; cursor: pointer; box-shadow: 0 4px 12px rgba(0,0,0,0.15); width: 60px; height: 60px; display: flex; align-items: center; justify-content: center; transition: transform 0.2s;">
+        <svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"></path></svg>
+    </button>
+    <div id="chat-window" style="display: none; position: absolute; bottom: 80px; right: 0; width: 350px; height: 500px; background: white; border-radius: 12px; box-shadow: 0 5px 20px rgba(0,0,0,0.2); flex-direction: column; overflow: hidden; border: 1px solid #eee;">
+        <div style="padding: 15px; background: #f8f9fa; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
+            <h3 style="margin: 0; font-size: 16px; font-weight: 600;">Chat with Document</h3>
+            <button id="chat-close" style="background: none; border: none; cursor: pointer; font-size: 18px;">&times;</button>
+        </div>
+        <div id="chat-messages" style="flex: 1; padding: 15px; overflow-y: auto; background: #fff;">
+            <div style="margin-bottom: 10px; color: #666; font-size: 14px;">Ask me anything about this document!</div>
+        </div>
+        <div style="padding: 15px; border-top: 1px solid #eee; display: flex; gap: 10px;">
+            <input type="text" id="chat-input" placeholder="Type a question..." style="flex: 1; padding: 10px; border: 1px solid #ddd; border-radius: 6px; outline: none;">
+            <button id="chat-send" style="background: #000; color: white; border: none; padding: 10px 15px; border-radius: 6px; cursor: pointer;">Send</button>
+        </div>
+    </div>
+</div>`;
+
+    function toggleChat() {
+        const w = document.getElementById('chat-window');
+        const b = document.getElementById('chat-toggle');
+        if (w.style.display === 'none') {
+            w.style.display = 'flex';
+            b.style.transform = 'scale(0.9)';
+        } else {
+            w.style.display = 'none';
+            b.style.transform = 'scale(1)';
+        }
+    }
+
+    function handleKeyPress(e) {
+        if (e.key === 'Enter') sendMessage();
+    }
+
+    async function sendMessage() {
+        const input = document.getElementById('chat-input');
+        const msgs = document.getElementById('chat-messages');
+        const text = input.value.trim();
+        if (!text) return;
+
+        // Add user message
+        msgs.innerHTML += `<div style="margin: 10px 0; text-align: right;"><span style="background: #000; color: white; padding: 8px 12px; border-radius: 12px 12px 0 12px; display: inline-block; font-size: 14px;">${text}</span></div>`;
+        input.value = '';
+        msgs.scrollTop = msgs.scrollHeight;
+
+        // Add loading
+        const loadingId = 'loading-' + Date.now();
+        msgs.innerHTML += `<div id="${loadingId}" style="margin: 10px 0; text-align: left;"><span style="background: #f1f1f1; color: #333; padding: 8px 12px; border-radius: 12px 12px 12px 0; display: inline-block; font-size: 14px;">Thinking...</span></div>`;
+        msgs.scrollTop = msgs.scrollHeight;
+
+        try {
+            const body = JSON.stringify({ dashboard_id: DASHBOARD_ID, message: text });
+            const res = await fetch('/api/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: body
+            });
+            if (!res.ok || !res.body) {
+                // Fall back to the buffered endpoint
+                const fallback = await fetch('/api/chat', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: body
+                });
+                const data = await fallback.json();
+                document.getElementById(loadingId).remove();
+                msgs.innerHTML += `<div style="margin: 10px 0; text-align: left;"><span style="background: #f1f1f1; color: #333; padding: 8px 12px; border-radius: 12px 12px 12px 0; display: inline-block; font-size: 14px;">${data.response}</span></div>`;
+            } else {
+                // Replace "Thinking..." with the answer as it streams in
+                const loading = document.getElementById(loadingId);
+                const bubble = loading.querySelector('span');
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let answer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    for (const evt of events) {
+                        if (!evt.startsWith('data: ')) continue;
+                        answer += JSON.parse(evt.slice(6)).delta;
+                        bubble.textContent = answer;
+                        msgs.scrollTop = msgs.scrollHeight;
+                    }
+                }
+                loading.removeAttribute('id');
+            }
+        } catch (e) {
+            document.getElementById(loadingId).remove();
+            msgs.innerHTML += `<div style="margin: 10px 0; text-align: left; color: red;">Error: ${e.message}</div>`;
+        }
+        msgs.scrollTop = msgs.scrollHeight;
+    }
+
+    // Deferred, so the dashboard body is already parsed
+    document.body.insertAdjacentHTML('beforeend', WIDGET_HTML);
+    document.getElementById('chat-toggle').addEventListener('click', toggleChat);
+    document.getElementById('chat-close').addEventListener('click', toggleChat);
+    document.getElementById('chat-send').addEventListener('click', sendMessage);
+    document.getElementById('chat-input').addEventListener('keypress', handleKeyPress);
+})();
@@ -76,8 +76,8 @@ function handleFileUpload(file) {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                // Redirect to dashboard
-                window.location.href = data.redirect;
+                // Analysis runs in the background; wait for the dashboard
+                return pollStatus(data.status_url);
             } else {
                 throw new Error(data.error || 'Upload failed');
             }
@@ -89,6 +89,28 @@ function handleFileUpload(file) {
         });
 }
 
+// Give up polling after this many checks (1.5s apart, about 15 minutes)
+const MAX_STATUS_POLLS = 600;
+
+// Poll an analysis job until its dashboard is ready, then open it
+function pollStatus(statusUrl, attempt = 1) {
+    return fetch(statusUrl)
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'ready') {
+                window.location.href = data.redirect;
+            } else if (data.status === 'processing') {
+                if (attempt >= MAX_STATUS_POLLS) {
+                    throw new Error('Analysis is taking too long. Please try again later.');
+                }
+                return new Promise(resolve => setTimeout(resolve, 1500))
+                    .then(() => pollStatus(statusUrl, attempt + 1));
+            } else {
+                throw new Error(data.error || 'Analysis failed');
+            }
+        });
+}
+
 // Add click handler to upload card
 uploadCard.addEventListener('click', (e) => {
     if (e.target.tagName !== 'BUTTON') {
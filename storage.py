@@ -0,0 +1,49 @@
+import os
+import threading
+
+def temp_path(path):
+    """Sibling temp file name unique to this process and thread
+    
+    Concurrent writers of the same file each get their own temp file, so
+    one can't truncate or swap in another's half-written data.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def write_atomic(path, data):
+    """Write bytes to a temp file and swap it into place
+    
+    Readers see either the previous file or the complete new one, never a
+    half-written file. os.replace (not rename) also overwrites on Windows.
+    """
+    tmp_path = temp_path(path)
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def create_exclusive(path, data):
+    """Create a file only if it doesn't exist yet; False if it already does
+    
+    O_EXCL makes check-and-create one step, so of several concurrent
+    callers exactly one gets True.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o644)
+    except FileExistsError:
+        return False
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+    return True